@@ -1,88 +1,107 @@
 # app.py
+import io
 import os
 import json
+import hashlib
 import datetime
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import streamlit as st
 from core_echoverse import (
     DEFAULT_TONES,
-    ensure_outputs_dir,
+    _dumps,
+    _ollama_models,
+    _session,
+    safe_name,
     save_text,
     rewrite_with_ollama,
-    tts_with_gtts_to_bytes,
+    tts_with_gtts_to_bytes_parallel,
 )
 
 # ---------- Page/setup ----------
 st.set_page_config(page_title="EchoVerse", page_icon="🎧", layout="wide")
 
-# ---------- Minimal DARK styles ----------
-st.markdown("""
-<style>
-:root{
-  --bg:#0e1116;                 /* page bg */
-  --panel:#12171f;              /* panels */
-  --panel-2:#171c25;            /* secondary panels */
-  --glass:rgba(255,255,255,.03);
-  --border:#232a35;
-  --text:#e8eaed;
-  --muted:#9aa0a6;
-  --focus:#9aa0a6;              /* subtle neutral accent */
-}
+# gTTS requests are I/O-bound HTTPS round-trips; this many in flight at once.
+TTS_WORKERS = 8
 
-/* background */
-html, body, [data-testid="stAppViewContainer"]{ background: var(--bg); }
-header { background: transparent; }
+# One keep-alive HTTP session for all Ollama traffic; st.cache_resource keeps
+# it alive across script reruns so we don't pay a TCP/TLS handshake each time.
+@st.cache_resource
+def get_http_session():
+    return _session()
 
-/* container spacing */
-.block-container{ padding-top: 2rem; }
+# Output files are written in the background so the audio player renders
+# without waiting on disk; st.audio/st.download_button use the in-memory
+# bytes anyway.
+@st.cache_resource
+def _io_pool():
+    return ThreadPoolExecutor(max_workers=2)
 
-/* titles */
-.echotitle{ display:flex; gap:.6rem; align-items:center; justify-content:center; margin-bottom:.25rem; }
-.echotitle h1{ margin:0; font-weight:800; letter-spacing:.3px; color:var(--text); }
-.caption{ color: var(--muted); font-size:.9rem; }
+def _write_file_atomic(path: Path, data: bytes):
+    # Write under a temp name and rename so the Past Narrations glob and the
+    # cached byte reader never see a half-written file.
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_bytes(data)
+    tmp.replace(path)
 
-/* cards */
-.echocard{
-  background: var(--glass);
-  border: 1px solid var(--border);
-  border-radius: 14px;
-  padding: 14px 16px;
-}
+def _on_write_done(errors):
+    # Failures are surfaced on the next rerun. The session-state list is
+    # captured here on the main thread: the callback runs on a worker thread,
+    # which can't look up st.session_state, and module-level names don't
+    # survive the rerun's fresh namespace.
+    def _cb(fut):
+        err = fut.exception()
+        if err is not None:
+            errors.append(err)
+        else:
+            # Only refresh the listing once the file actually exists on disk.
+            _list_outputs.clear()
+    return _cb
 
-/* Streamlit widgets: keep neutral, dark */
-.stTextArea textarea, .stSelectbox div[data-baseweb="select"] > div, .stFileUploader, .stTextInput input{
-  color: var(--text);
-}
-.stFileUploader, .stSelectbox, .stTextArea, .stTextInput{
-  background: var(--panel);
-  border: 1px solid var(--border);
-  border-radius: 12px;
-  padding: 8px;
-}
+# The outputs dir never moves, so create it once per process; the glob walk
+# in the Past Narrations expander is cached briefly and invalidated whenever
+# a new narration is generated.
+@st.cache_resource
+def _outputs() -> Path:
+    p = Path("outputs")
+    p.mkdir(parents=True, exist_ok=True)
+    return p
 
-/* Buttons */
-.stButton>button{
-  width:100%;
-  background: #1b212b;
-  color: var(--text);
-  border: 1px solid var(--border);
-  border-radius: 12px;
-  padding: .6rem 1rem;
-}
-.stButton>button:hover{ background:#202634; border-color:#2a3340; }
-.stButton>button:focus{ outline: 2px solid var(--focus); }
+@st.cache_data(ttl=30, show_spinner=False)
+def _list_outputs(p: str) -> list:
+    return [str(f) for f in sorted(Path(p).glob("speech_*.mp3"), reverse=True)]
 
-/* Sidebar */
-section[data-testid="stSidebar"]{
-  background: var(--panel-2);
-  border-right: 1px solid var(--border);
-}
+# ---------- Cached pipeline stages ----------
+# Streamlit reruns this script top-to-bottom on every widget interaction, so
+# identical inputs must not re-pay the Ollama/gTTS round-trips. Keys are
+# derived automatically from the (hashable) arguments.
+# The installed-model list only has to be fresh-ish; a 60s TTL keeps the
+# extra /api/tags round-trip off the generate hot path.
+@st.cache_data(ttl=60, show_spinner=False)
+def _models_cached(base_url):
+    return _ollama_models(base_url, session=get_http_session())
 
-/* Expander */
-.streamlit-expanderHeader{ color: var(--text); }
-</style>
-""", unsafe_allow_html=True)
+@st.cache_data(show_spinner=False, max_entries=128, ttl=24 * 3600)
+def _cached_rewrite(text, tone, model, base_url, temperature, max_tokens):
+    return rewrite_with_ollama(
+        text, tone=tone, model=model, base_url=base_url,
+        temperature=temperature, max_tokens=max_tokens,
+        session=get_http_session(),
+        models=_models_cached(base_url)
+    )
+
+@st.cache_data(show_spinner=False, max_entries=128)
+def _cached_tts(text, lang, tld, slow):
+    return tts_with_gtts_to_bytes_parallel(text, lang=lang, tld=tld, slow=slow, workers=TTS_WORKERS)
+
+# ---------- Minimal DARK styles ----------
+@st.cache_data(show_spinner=False)
+def _css() -> str:
+    return Path("assets/styles.css").read_text(encoding="utf-8")
+
+st.markdown(f"<style>{_css()}</style>", unsafe_allow_html=True)
 
 # ---------- Sidebar (settings) ----------
 with st.sidebar:
@@ -92,6 +111,11 @@ with st.sidebar:
     temperature = st.slider("Temperature", 0.0, 1.5, 0.7, 0.05)
     max_tokens = st.slider("Max Tokens", 64, 2048, 512, 32)
     st.markdown("<div class='caption'>Make sure the model is pulled locally via <code>ollama pull</code>.</div>", unsafe_allow_html=True)
+    st.markdown("<div class='caption'>For faster long texts, start the server with <code>OLLAMA_NUM_PARALLEL=4</code>.</div>", unsafe_allow_html=True)
+    if st.button("Clear cache"):
+        _cached_rewrite.clear()
+        _cached_tts.clear()
+        st.toast("Cache cleared.")
 
 # ---------- Header ----------
 st.markdown("<div class='echotitle'><span style='font-size:1.4rem'>🎧</span><h1>EchoVerse</h1></div>", unsafe_allow_html=True)
@@ -116,11 +140,34 @@ st.markdown("<div class='caption'>TXT · up to ~200MB</div>", unsafe_allow_html=
 st.markdown("#### Or paste your text here:")
 text = st.text_area("Input", height=160, label_visibility="collapsed", placeholder="Paste your text here...")
 
+# Hard cap on characters read from an upload, and how much of the text is
+# rendered in the preview cards (the full string stays off the DOM).
+MAX_UPLOAD_CHARS = 2_000_000
+DISPLAY_CHARS = 4000
+
 if uploaded is not None:
     try:
-        text = uploaded.read().decode("utf-8")
+        # Stream-decode in 64 KB blocks instead of slurping the whole file
+        # (uploads may be up to ~200 MB) into memory at once.
+        wrapper = io.TextIOWrapper(uploaded, encoding="utf-8", errors="ignore")
+        parts, total = [], 0
+        for chunk in iter(lambda: wrapper.read(65536), ""):
+            parts.append(chunk)
+            total += len(chunk)
+            if total > MAX_UPLOAD_CHARS:
+                st.warning(f"File truncated to the first {MAX_UPLOAD_CHARS:,} characters.")
+                break
+        text = "".join(parts)
     except Exception:
-        text = uploaded.getvalue().decode(errors="ignore")
+        # getvalue() would copy the underlying BytesIO a second time; rewind
+        # and read once instead so only one copy of the buffer is alive.
+        uploaded.seek(0)
+        raw = uploaded.read()
+        text = raw.decode("utf-8", errors="replace")
+        del raw
+
+def _preview(s: str) -> str:
+    return s if len(s) <= DISPLAY_CHARS else s[:DISPLAY_CHARS] + "…"
 
 # ---------- Selections ----------
 st.markdown("#### Select Voice")
@@ -136,102 +183,134 @@ with c1:
     gen = st.button("Generate Audiobook")
 
 # ---------- State ----------
-if "rewritten" not in st.session_state:
-    st.session_state.rewritten = ""
-if "audio_bytes" not in st.session_state:
-    st.session_state.audio_bytes = b""
-if "audio_mime" not in st.session_state:
-    st.session_state.audio_mime = "audio/mp3"
-if "last_meta" not in st.session_state:
-    st.session_state.last_meta = {}
-
-def _safe_name(s: str) -> str:
-    return "".join(c for c in s if c.isalnum() or c in ("-","_")).strip("_")
+# Results live in an LRU dict keyed by a hash of every input that affects the
+# output, so re-clicking Generate with unchanged inputs (or flipping back to a
+# recent combination) short-circuits the whole pipeline.
+RESULT_CACHE_MAX = 16
+
+if "results" not in st.session_state:
+    st.session_state.results = OrderedDict()
+if "current" not in st.session_state:
+    st.session_state.current = None
+if "write_errors" not in st.session_state:
+    st.session_state.write_errors = []
+
+def _result_key(text, tone, model, temperature, max_tokens, voice_name) -> str:
+    raw = f"{text}|{tone}|{model}|{temperature}|{max_tokens}|{voice_name}"
+    return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
 
 # ---------- Generate ----------
 if gen:
     if not text or not text.strip():
         st.warning("Please provide some input text (upload a .txt or paste text).")
     else:
-        try:
-            with st.spinner("Rewriting with Ollama…"):
-                rewritten = rewrite_with_ollama(
-                    text.strip(),
-                    tone=tone,
-                    model=model,
-                    base_url=ollama_url,
-                    temperature=temperature,
-                    max_tokens=max_tokens
-                )
-            st.session_state.rewritten = rewritten
-
-            v = VOICE_PRESETS[voice_name]
-            with st.spinner("Generating audio with gTTS…"):
-                audio_bytes = tts_with_gtts_to_bytes(rewritten, lang=v["lang"], tld=v["tld"], slow=v["slow"])
-            st.session_state.audio_bytes = audio_bytes
-            st.session_state.audio_mime = "audio/mp3"
-
-            outputs = ensure_outputs_dir()
-            ts = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
-            tone_safe = _safe_name(tone)
-            txt_path = save_text(rewritten, tone)
-            mp3_path = outputs / f"speech_{tone_safe}_{ts}.mp3"
-            mp3_path.write_bytes(audio_bytes)
-
-            meta = {
-                "timestamp": ts, "tone": tone, "voice": voice_name,
-                "model": model, "ollama_url": ollama_url,
-                "temperature": temperature, "max_tokens": max_tokens,
-                "text_file": str(txt_path), "audio_file": str(mp3_path)
-            }
-            (outputs / f"meta_{tone_safe}_{ts}.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
-            st.session_state.last_meta = meta
-
-            st.success("Audiobook generated successfully.")
-        except Exception as e:
-            st.error(str(e))
+        results = st.session_state.results
+        key = _result_key(text.strip(), tone, model, temperature, max_tokens, voice_name)
+        if key in results:
+            results.move_to_end(key)
+            st.session_state.current = key
+            st.success("Audiobook restored from this session.")
+        else:
+            try:
+                v = VOICE_PRESETS[voice_name]
+                with st.spinner("Generating audiobook…"):
+                    rewritten = _cached_rewrite(
+                        text.strip(), tone, model, ollama_url, temperature, max_tokens
+                    )
+                    audio_bytes = _cached_tts(rewritten, v["lang"], v["tld"], v["slow"])
+
+                outputs = _outputs()
+                ts = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+                tone_safe = safe_name(tone)
+                txt_path = save_text(rewritten, tone)
+                mp3_path = outputs / f"speech_{tone_safe}_{ts}.mp3"
+                _io_pool().submit(_write_file_atomic, mp3_path, audio_bytes).add_done_callback(
+                    _on_write_done(st.session_state.write_errors))
+
+                meta = {
+                    "timestamp": ts, "tone": tone, "voice": voice_name,
+                    "model": model, "ollama_url": ollama_url,
+                    "temperature": temperature, "max_tokens": max_tokens,
+                    "text_file": str(txt_path), "audio_file": str(mp3_path)
+                }
+                _io_pool().submit(_write_file_atomic, outputs / f"meta_{tone_safe}_{ts}.json", _dumps(meta)).add_done_callback(
+                    _on_write_done(st.session_state.write_errors))
+
+                results[key] = {
+                    "rewritten": rewritten,
+                    "audio_bytes": audio_bytes,
+                    "audio_mime": "audio/mp3",
+                    "meta": meta,
+                }
+                while len(results) > RESULT_CACHE_MAX:
+                    results.popitem(last=False)
+                st.session_state.current = key
+
+                st.success("Audiobook generated successfully.")
+            except Exception as e:
+                st.error(str(e))
 
 # ---------- Output ----------
-if st.session_state.rewritten:
+while st.session_state.write_errors:
+    st.warning(f"Saving a previous narration to disk failed: {st.session_state.write_errors.pop(0)}")
+
+result = st.session_state.results.get(st.session_state.current) if st.session_state.current else None
+
+if result and result["rewritten"]:
     st.markdown("### Original vs Rewritten Text")
     c1, c2 = st.columns(2)
     with c1:
         st.markdown("**Original Text**")
-        st.markdown(f"<div class='echocard'>{text}</div>", unsafe_allow_html=True)
+        st.markdown(f"<div class='echocard'>{_preview(text)}</div>", unsafe_allow_html=True)
     with c2:
         st.markdown("**Rewritten Text**")
-        st.markdown(f"<div class='echocard'>{st.session_state.rewritten}</div>", unsafe_allow_html=True)
+        st.markdown(f"<div class='echocard'>{_preview(result['rewritten'])}</div>", unsafe_allow_html=True)
 
-if st.session_state.audio_bytes:
+if result and result["audio_bytes"]:
     st.markdown("### Listen to Your Audiobook")
-    st.audio(st.session_state.audio_bytes, format=st.session_state.audio_mime)
+    st.audio(result["audio_bytes"], format=result["audio_mime"])
 
-    outputs = ensure_outputs_dir()
-    ts = st.session_state.last_meta.get("timestamp", datetime.datetime.now().strftime("%Y%m%d-%H%M%S"))
-    tone_safe = _safe_name(tone)
+    outputs = _outputs()
+    ts = result["meta"].get("timestamp", datetime.datetime.now().strftime("%Y%m%d-%H%M%S"))
+    tone_safe = safe_name(tone)
     st.download_button(
         "Download MP3",
-        data=st.session_state.audio_bytes,
+        data=result["audio_bytes"],
         file_name=f"speech_{tone_safe}_{ts}.mp3",
         mime="audio/mp3"
     )
 
+# Past narrations are immutable once written, so their bytes and meta can be
+# cached instead of re-read from disk on every rerun of the expander.
+@st.cache_data(ttl=300, show_spinner=False)
+def _read_file_bytes(p: str) -> bytes:
+    return Path(p).read_bytes()
+
+@st.cache_data(show_spinner=False)
+def _read_meta(p: str) -> dict:
+    return json.loads(Path(p).read_text(encoding="utf-8"))
+
+PAST_NARRATIONS_PAGE = 10
+
 with st.expander("View Past Narrations"):
-    out = ensure_outputs_dir()
-    files = sorted(out.glob("speech_*.mp3"), reverse=True)
+    out = _outputs()
+    files = [Path(p) for p in _list_outputs(str(out))]
     if not files:
         st.caption("No previous narrations yet.")
     else:
-        for f in files[:20]:
+        show_all = False
+        if len(files) > PAST_NARRATIONS_PAGE:
+            show_all = st.toggle(f"Show all {len(files)} narrations")
+        for f in (files if show_all else files[:PAST_NARRATIONS_PAGE]):
             meta_path = out / f"meta_{'_'.join(f.stem.split('_')[1:])}.json"
             col_a, col_b = st.columns([3,1])
             with col_a:
                 st.write(f"**{f.name}**")
                 if meta_path.exists():
                     try:
-                        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+                        meta = _read_meta(str(meta_path))
                         st.caption(f"Tone: {meta.get('tone')} · Voice: {meta.get('voice')} · Model: {meta.get('model')} · {meta.get('timestamp')}")
                     except Exception:
                         pass
             with col_b:
-                st.download_button("Download", data=f.read_bytes(), file_name=f.name, mime="audio/mp3", use_container_width=True)
+                st.download_button("Download", data=_read_file_bytes(str(f)), file_name=f.name, mime="audio/mp3", use_container_width=True)
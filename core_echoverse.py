@@ -1,14 +1,20 @@
 # core_echoverse.py
 #!/usr/bin/env python3
 
+import atexit
+import io
 import json
 import os
+import re
 import sys
 import textwrap
+import threading
 import datetime
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import requests
+from requests.adapters import HTTPAdapter, Retry
 
 try:
     from gtts import gTTS
@@ -16,6 +22,44 @@ try:
 except Exception:
     _HAS_GTTS = False
 
+# Optional semantic cache: users iterating on slightly-edited text rarely
+# produce byte-identical prompts, so exact-match caches miss. A nearest-
+# neighbour lookup over (tone, text) embeddings turns a 5-30s LLM call into
+# a ~1ms vector search when the input is near-identical.
+# Install with: pip install sentence-transformers faiss-cpu
+try:
+    import faiss
+    from sentence_transformers import SentenceTransformer
+    _HAS_SEMCACHE = True
+except Exception:
+    _HAS_SEMCACHE = False
+
+# orjson is ~2-10x faster than stdlib json for bodies carrying long strings
+# (prompts, rewritten text); fall back silently when it isn't installed.
+try:
+    import orjson
+    _HAS_ORJSON = True
+
+    def _loads(data):
+        return orjson.loads(data)
+
+    def _dumps(obj) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+
+    def _dumps_compact(obj) -> bytes:
+        return orjson.dumps(obj)
+except Exception:
+    _HAS_ORJSON = False
+
+    def _loads(data):
+        return json.loads(data)
+
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj, indent=2).encode("utf-8")
+
+    def _dumps_compact(obj) -> bytes:
+        return json.dumps(obj).encode("utf-8")
+
 
 DEFAULT_TONES = [
     "Neutral","Suspenseful","Inspiring","Joyful","Calm","Dramatic","Motivational",
@@ -23,6 +67,13 @@ DEFAULT_TONES = [
     "Romantic","Cinematic","Narrative","Empathetic",
 ]
 
+# Compiled once; re.sub runs in C, unlike a per-character Python loop.
+_SAFE_RE = re.compile(r"[^A-Za-z0-9_-]+")
+
+def safe_name(s: str) -> str:
+    """Reduce a string to filename-safe characters."""
+    return _SAFE_RE.sub("", s).strip("_")
+
 def ensure_outputs_dir() -> Path:
     out_dir = Path("outputs")
     out_dir.mkdir(parents=True, exist_ok=True)
@@ -31,25 +82,46 @@ def ensure_outputs_dir() -> Path:
 def save_text(text: str, tone: str) -> Path:
     ts = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
     out_dir = ensure_outputs_dir()
-    safe_tone = "".join(c for c in tone if c.isalnum() or c in ("-", "_")).strip("_")
+    safe_tone = safe_name(tone)
     path = out_dir / f"rewritten_{safe_tone}_{ts}.txt"
     path.write_text(text, encoding="utf-8")
     return path
 
+# ---------- HTTP ----------
+def _session() -> requests.Session:
+    """Build a keep-alive session with a pooled adapter.
+
+    Reusing one session across Ollama calls skips the per-request TCP/TLS
+    handshake and lets the parallel chunk requests share connections.
+    Callers (e.g. the Streamlit app) should cache the returned session.
+    """
+    s = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=16,
+        pool_maxsize=16,
+        max_retries=Retry(total=2, backoff_factor=0.3),
+    )
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    return s
+
 # ---------- Ollama helpers ----------
-def _ollama_models(base_url: str):
+def _ollama_models(base_url: str, session=None):
     url = f"{base_url.rstrip('/')}/api/tags"
     try:
-        r = requests.get(url, timeout=15)
+        r = (session or requests).get(url, timeout=15)
         if r.status_code != 200:
             return []
-        data = r.json()
+        data = _loads(r.content)
         return [m.get("name") for m in data.get("models", []) if m.get("name")]
     except requests.RequestException:
         return []
 
-def ensure_model_present(model: str, base_url: str):
-    models = _ollama_models(base_url)
+def ensure_model_present(model: str, base_url: str, session=None, models=None):
+    # Callers may pass a pre-fetched (e.g. TTL-cached) model list to keep the
+    # extra /api/tags round-trip off the generate hot path.
+    if models is None:
+        models = _ollama_models(base_url, session=session)
     if model not in models:
         msg = (
             f"Ollama model '{model}' not found at {base_url}.\n"
@@ -61,64 +133,357 @@ def ensure_model_present(model: str, base_url: str):
         )
         raise RuntimeError(msg)
 
-def rewrite_with_ollama(
-    text: str,
+# Max characters per LLM chunk; long inputs are split on paragraph/sentence
+# boundaries and rewritten concurrently. The server only runs chunks in
+# parallel if OLLAMA_NUM_PARALLEL allows it (see README).
+_CHUNK_CHARS = 1500
+
+def _num_parallel() -> int:
+    try:
+        return max(1, int(os.getenv("OLLAMA_NUM_PARALLEL", "4")))
+    except ValueError:
+        return 4
+
+def _split_chunks(text: str, limit: int = _CHUNK_CHARS):
+    if len(text) <= limit:
+        return [text]
+    pieces = []
+    for para in text.split("\n\n"):
+        if len(para) <= limit:
+            pieces.append(para)
+            continue
+        for sent in re.split(r"(?<=[.!?])\s+", para):
+            if len(sent) <= limit:
+                pieces.append(sent)
+            else:
+                pieces.extend(textwrap.wrap(sent, limit))
+    # Greedily re-merge small pieces so we don't fire one request per sentence.
+    chunks, buf = [], ""
+    for p in pieces:
+        if not p:
+            continue
+        if buf and len(buf) + len(p) + 2 > limit:
+            chunks.append(buf)
+            buf = p
+        else:
+            buf = f"{buf}\n\n{p}" if buf else p
+    if buf:
+        chunks.append(buf)
+    return chunks
+
+# Built once at import; avoids textwrap.dedent's per-call scan, which adds up
+# when the parallel-chunk path builds N prompts per rewrite.
+_PROMPT_TMPL = (
+    "You are a writing assistant.\n"
+    "\n"
+    "Task: Rewrite the user's text in a **{tone}** tone.\n"
+    "Rules:\n"
+    "- Preserve the original meaning and key facts.\n"
+    "- Keep it clear and natural.\n"
+    "- Maintain the original language (do NOT translate).\n"
+    "- Use an appropriate register for the tone.\n"
+    "- Output ONLY the rewritten text—no preface, no quotes, no explanations.\n"
+    "\n"
+    "User text:\n"
+    "---\n"
+    "{text}\n"
+    "---"
+)
+
+def _build_prompt(chunk: str, tone: str) -> str:
+    return _PROMPT_TMPL.format(tone=tone, text=chunk)
+
+# ---------- Semantic cache ----------
+# Cosine similarity above which a stored rewrite is considered a hit.
+_SEM_THRESHOLD = 0.97
+_SEM_EMBED_DIM = 384  # all-MiniLM-L6-v2
+_SEM_CACHE_FILE = "cache.json"
+
+_sem_model = None
+_sem_index = None
+_sem_store = []  # [{"key": "<tone>|<text>", "result": "<rewrite>"}, ...]
+# Streamlit serves sessions from multiple threads; the index and store must
+# stay in sync, so every lookup/add runs under this lock.
+_sem_lock = threading.Lock()
+
+def _sem_embed(keys):
+    global _sem_model
+    if _sem_model is None:
+        _sem_model = SentenceTransformer("all-MiniLM-L6-v2")
+    return _sem_model.encode(keys, normalize_embeddings=True)
+
+def _sem_ensure_index():
+    """Lazily build the index, re-embedding any entries persisted on disk."""
+    global _sem_index
+    if _sem_index is not None:
+        return
+    _sem_index = faiss.IndexFlatIP(_SEM_EMBED_DIM)
+    cache_path = ensure_outputs_dir() / _SEM_CACHE_FILE
+    if cache_path.exists():
+        try:
+            _sem_store.extend(_loads(cache_path.read_bytes()))
+        except Exception:
+            _sem_store.clear()
+    if _sem_store:
+        _sem_index.add(_sem_embed([e["key"] for e in _sem_store]))
+
+def _sem_lookup(key: str):
+    """Return (cached rewrite or None, embedding of key)."""
+    if not _HAS_SEMCACHE:
+        return None, None
+    with _sem_lock:
+        _sem_ensure_index()
+        vec = _sem_embed([key])
+        if _sem_index.ntotal:
+            scores, ids = _sem_index.search(vec, 1)
+            if scores[0][0] >= _SEM_THRESHOLD:
+                return _sem_store[ids[0][0]]["result"], vec
+    return None, vec
+
+def _sem_remember(key: str, vec, result: str):
+    if vec is None:
+        return
+    with _sem_lock:
+        _sem_index.add(vec)
+        _sem_store.append({"key": key, "result": result})
+
+def _sem_save():
+    with _sem_lock:
+        if _sem_store:
+            try:
+                (ensure_outputs_dir() / _SEM_CACHE_FILE).write_bytes(_dumps(_sem_store))
+            except OSError:
+                pass
+
+if _HAS_SEMCACHE:
+    atexit.register(_sem_save)
+
+# keep_alive holds the model resident between bursts of chunk requests
+# (re-loading a multi-GB model dwarfs any single generate); num_batch and
+# num_thread let the server use its full batch width across parallel streams.
+def _gen_options(temperature: float, max_tokens: int) -> dict:
+    return {
+        "temperature": temperature,
+        "num_predict": max_tokens,
+        "num_batch": 512,
+        "num_thread": os.cpu_count() or 8,
+    }
+
+def _keep_alive() -> str:
+    return os.getenv("OLLAMA_KEEP_ALIVE", "10m")
+
+def _raise_for_status(r, model: str):
+    if r.status_code == 404 and "not found" in r.text.lower():
+        raise RuntimeError(
+            f"Ollama says the model '{model}' is not found.\n"
+            f"Run:  ollama pull {model}\n"
+            f"Raw response: {r.text}"
+        )
+    raise RuntimeError(f"Ollama returned HTTP {r.status_code}: {r.text}")
+
+def _rewrite_chunk(
+    chunk: str,
     tone: str,
-    model: str = "gemma3:4b",
-    base_url: str = "http://localhost:11434",
-    temperature: float = 0.7,
-    max_tokens: int = 512,
+    model: str,
+    base_url: str,
+    temperature: float,
+    max_tokens: int,
+    session=None,
 ) -> str:
-    ensure_model_present(model, base_url)
     url = f"{base_url.rstrip('/')}/api/generate"
-    prompt = textwrap.dedent(f"""
-    You are a writing assistant.
-
-    Task: Rewrite the user's text in a **{tone}** tone.
-    Rules:
-    - Preserve the original meaning and key facts.
-    - Keep it clear and natural.
-    - Maintain the original language (do NOT translate).
-    - Use an appropriate register for the tone.
-    - Output ONLY the rewritten text—no preface, no quotes, no explanations.
-
-    User text:
-    ---
-    {text}
-    ---
-    """).strip()
-
     payload = {
         "model": model,
-        "prompt": prompt,
+        "prompt": _build_prompt(chunk, tone),
         "stream": False,
-        "options": {"temperature": temperature, "num_predict": max_tokens}
+        "keep_alive": _keep_alive(),
+        "options": _gen_options(temperature, max_tokens)
     }
 
+    # Pre-encode the body: skips requests' stdlib-json pass, which is
+    # measurable for multi-KB prompts repeated once per chunk.
     try:
-        r = requests.post(url, json=payload, timeout=120)
+        r = (session or requests).post(
+            url, data=_dumps_compact(payload),
+            headers={"Content-Type": "application/json"}, timeout=120
+        )
     except requests.RequestException as e:
         raise RuntimeError(f"Failed to reach Ollama at {url}. Error: {e}")
 
     if r.status_code != 200:
-        if r.status_code == 404 and "not found" in r.text.lower():
-            raise RuntimeError(
-                f"Ollama says the model '{model}' is not found.\n"
-                f"Run:  ollama pull {model}\n"
-                f"Raw response: {r.text}"
-            )
-        raise RuntimeError(f"Ollama returned HTTP {r.status_code}: {r.text}")
-
-    data = r.json()
+        _raise_for_status(r, model)
+
+    data = _loads(r.content)
     if "response" not in data:
         raise RuntimeError(f"Unexpected Ollama response: {json.dumps(data)[:500]}")
     return data["response"].strip()
 
+# Boundary after which a buffered sentence is flushed to the callback.
+_SENT_BOUNDARY = re.compile(r"[.!?]\s|\n")
+
+def _stream_chunk(
+    chunk: str,
+    tone: str,
+    model: str,
+    base_url: str,
+    temperature: float,
+    max_tokens: int,
+    on_sentence,
+    session=None,
+) -> str:
+    url = f"{base_url.rstrip('/')}/api/generate"
+    payload = {
+        "model": model,
+        "prompt": _build_prompt(chunk, tone),
+        "stream": True,
+        "keep_alive": _keep_alive(),
+        "options": _gen_options(temperature, max_tokens)
+    }
+
+    try:
+        r = (session or requests).post(
+            url, data=_dumps_compact(payload),
+            headers={"Content-Type": "application/json"}, stream=True, timeout=120
+        )
+    except requests.RequestException as e:
+        raise RuntimeError(f"Failed to reach Ollama at {url}. Error: {e}")
+
+    if r.status_code != 200:
+        _raise_for_status(r, model)
+
+    pieces, buf = [], ""
+    for line in r.iter_lines():
+        if not line:
+            continue
+        data = _loads(line)
+        token = data.get("response", "")
+        if token:
+            pieces.append(token)
+            buf += token
+            while True:
+                m = _SENT_BOUNDARY.search(buf)
+                if not m:
+                    break
+                sent, buf = buf[:m.end()].strip(), buf[m.end():]
+                if sent:
+                    on_sentence(sent)
+        if data.get("done"):
+            break
+    tail = buf.strip()
+    if tail:
+        on_sentence(tail)
+    return "".join(pieces).strip()
+
+def rewrite_with_ollama(
+    text: str,
+    tone: str,
+    model: str = "gemma3:4b",
+    base_url: str = "http://localhost:11434",
+    temperature: float = 0.7,
+    max_tokens: int = 512,
+    on_sentence=None,
+    session=None,
+    models=None,
+) -> str:
+    ensure_model_present(model, base_url, session=session, models=models)
+    # Near-identical (tone, text) pairs short-circuit to the semantic cache.
+    # Streaming callers skip it so their sentence callbacks still fire.
+    sem_key, sem_vec = None, None
+    if on_sentence is None:
+        sem_key = f"{tone}|{text}"
+        try:
+            cached, sem_vec = _sem_lookup(sem_key)
+        except Exception:
+            # Cache trouble (e.g. embedding model not downloadable) must
+            # degrade to a plain rewrite, never fail it.
+            cached, sem_key = None, None
+        if cached is not None:
+            return cached
+    chunks = _split_chunks(text)
+    if on_sentence is not None:
+        # Streaming mode: chunks run sequentially so sentences reach the
+        # callback in document order as soon as the model emits them.
+        return "\n\n".join(
+            _stream_chunk(ch, tone, model, base_url, temperature, max_tokens,
+                          on_sentence, session=session)
+            for ch in chunks
+        )
+    if len(chunks) == 1:
+        result = _rewrite_chunk(chunks[0], tone, model, base_url, temperature,
+                                max_tokens, session=session)
+    else:
+        workers = min(len(chunks), _num_parallel())
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            results = list(ex.map(
+                lambda ch: _rewrite_chunk(ch, tone, model, base_url, temperature,
+                                          max_tokens, session=session),
+                chunks,
+            ))
+        result = "\n\n".join(r for r in results if r)
+    if sem_key is not None:
+        try:
+            _sem_remember(sem_key, sem_vec, result)
+        except Exception:
+            pass
+    return result
+
 # ---------- gTTS ----------
+class _NoCloseSession(requests.Session):
+    """Session whose close() is a no-op, so gTTS's internal
+    `with requests.Session() as s:` blocks can't tear down the shared pool."""
+    def close(self):
+        pass
+
+class _PooledRequestsProxy:
+    """Stand-in for the requests module inside gtts.tts that hands out one
+    shared keep-alive session; per-sentence TTS calls then reuse pooled
+    HTTPS connections instead of paying a TLS handshake each."""
+    def __init__(self, session):
+        self._session = session
+
+    def Session(self):
+        return self._session
+
+    def __getattr__(self, name):
+        return getattr(requests, name)
+
+if _HAS_GTTS:
+    try:
+        import gtts.tts as _gtts_mod
+        _tts_http = _NoCloseSession()
+        _tts_http.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=16))
+        # Rebinds only gtts.tts's view of `requests`; the real module is untouched.
+        _gtts_mod.requests = _PooledRequestsProxy(_tts_http)
+    except Exception:
+        pass
+
 def tts_with_gtts_to_bytes(text: str, lang: str = "en", tld: str = "com", slow: bool = False) -> bytes:
     if not _HAS_GTTS:
         raise RuntimeError("gTTS not installed. Install with: pip install gTTS")
-    import io
     buf = io.BytesIO()
     gTTS(text=text, lang=lang, tld=tld, slow=slow).write_to_fp(buf)
     return buf.getvalue()
+
+def tts_with_gtts_to_bytes_parallel(
+    text: str,
+    lang: str = "en",
+    tld: str = "com",
+    slow: bool = False,
+    workers: int = 8,
+) -> bytes:
+    """Synthesize sentence-by-sentence with concurrent gTTS requests.
+
+    gTTS is network-bound, so a thread pool gives near-linear speedup for
+    long texts. MP3 frames are self-synchronizing, so the per-sentence
+    blobs concatenate into one playable stream.
+    """
+    if not _HAS_GTTS:
+        raise RuntimeError("gTTS not installed. Install with: pip install gTTS")
+    sentences = [s for s in re.split(r"(?<=[.!?])\s+", text) if s.strip()]
+    if len(sentences) <= 1:
+        return tts_with_gtts_to_bytes(text, lang=lang, tld=tld, slow=slow)
+    with ThreadPoolExecutor(max_workers=min(workers, len(sentences))) as ex:
+        parts = list(ex.map(
+            lambda s: tts_with_gtts_to_bytes(s, lang=lang, tld=tld, slow=slow),
+            sentences,
+        ))
+    return b"".join(parts)
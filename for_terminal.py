@@ -1,10 +1,10 @@
 #!/usr/bin/env python3
 
 import argparse
+import asyncio
 import json
 import os
 import sys
-import textwrap
 import datetime
 import shutil
 import subprocess
@@ -12,19 +12,21 @@ from pathlib import Path
 
 import requests
 
+from core_echoverse import (
+    _PROMPT_TMPL,
+    _dumps_compact,
+    _gen_options,
+    _keep_alive,
+    _loads,
+    safe_name,
+)
+
 try:
     from gtts import gTTS
     _HAS_GTTS = True
 except Exception:
     _HAS_GTTS = False
 
-try:
-    from pydub import AudioSegment
-    _HAS_PYDUB = True
-except Exception:
-    _HAS_PYDUB = False
-
-
 DEFAULT_TONES = [
     "Neutral",
     "Suspenseful",
@@ -96,8 +98,11 @@ def ollama_models(base_url: str):
         return []
 
 
-def ensure_model_present(model: str, base_url: str):
-    models = ollama_models(base_url)
+def ensure_model_present(model: str, base_url: str, models=None):
+    # Callers may pass a pre-fetched model list (batch mode verifies once)
+    # to skip the /api/tags round-trip.
+    if models is None:
+        models = ollama_models(base_url)
     if model not in models:
         msg = (
             f"Ollama model '{model}' not found at {base_url}.\n"
@@ -118,42 +123,29 @@ def rewrite_with_ollama(
     base_url: str = "http://localhost:11434",
     temperature: float = 0.7,
     max_tokens: int = 512,
+    models=None,
 ) -> str:
     """
     Uses Ollama /api/generate with stream=False to rewrite text in a given tone.
     """
-    ensure_model_present(model, base_url)
+    ensure_model_present(model, base_url, models=models)
 
     url = f"{base_url.rstrip('/')}/api/generate"
-    prompt = textwrap.dedent(f"""
-    You are a writing assistant.
-
-    Task: Rewrite the user's text in a **{tone}** tone.
-    Rules:
-    - Preserve the original meaning and key facts.
-    - Keep it clear and natural.
-    - Maintain the original language (do NOT translate).
-    - Use an appropriate register for the tone.
-    - Output ONLY the rewritten text—no preface, no quotes, no explanations.
-
-    User text:
-    ---
-    {text}
-    ---
-    """).strip()
+    prompt = _PROMPT_TMPL.format(tone=tone, text=text)
 
     payload = {
         "model": model,
         "prompt": prompt,
         "stream": False,
-        "options": {
-            "temperature": temperature,
-            "num_predict": max_tokens
-        }
+        "keep_alive": _keep_alive(),
+        "options": _gen_options(temperature, max_tokens)
     }
 
     try:
-        r = requests.post(url, json=payload, timeout=120)
+        r = requests.post(
+            url, data=_dumps_compact(payload),
+            headers={"Content-Type": "application/json"}, timeout=120
+        )
     except requests.RequestException as e:
         raise RuntimeError(f"Failed to reach Ollama at {url}. Error: {e}")
 
@@ -167,7 +159,7 @@ def rewrite_with_ollama(
             )
         raise RuntimeError(f"Ollama returned HTTP {r.status_code}: {r.text}")
 
-    data = r.json()
+    data = _loads(r.content)
     if "response" not in data:
         raise RuntimeError(f"Unexpected Ollama response: {json.dumps(data)[:500]}")
 
@@ -183,7 +175,7 @@ def ensure_outputs_dir() -> Path:
 def save_text(text: str, tone: str) -> Path:
     ts = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
     out_dir = ensure_outputs_dir()
-    safe_tone = "".join(c for c in tone if c.isalnum() or c in ("-", "_")).strip("_")
+    safe_tone = safe_name(tone)
     path = out_dir / f"rewritten_{safe_tone}_{ts}.txt"
     path.write_text(text, encoding="utf-8")
     return path
@@ -196,42 +188,108 @@ def tts_with_gtts(text: str, lang: str, mp3_path: Path):
     tts.save(str(mp3_path))
 
 
-def run_cmd(cmd: list):
-    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-    return proc.returncode, proc.stdout, proc.stderr
+def _piper_sample_rate(model_path: Path, default: int = 22050) -> int:
+    """Read the voice's PCM rate from the .onnx.json config shipped next to
+    the model. Piper voices differ (x_low/low models run at 16 kHz); encoding
+    raw PCM at the wrong rate produces pitched-up, sped-up audio."""
+    config_path = Path(str(model_path) + ".json")
+    try:
+        cfg = _loads(config_path.read_bytes())
+        return int(cfg["audio"]["sample_rate"])
+    except (OSError, KeyError, TypeError, ValueError):
+        return default
 
 
-def tts_with_piper(text: str, model_path: Path, out_mp3_path: Path):
+def tts_with_piper(text: str, model_path: Path, out_mp3_path: Path, sample_rate: int = None):
     """
-    Uses Piper CLI to synthesize a WAV and then converts to MP3.
-    Requires 'piper' installed and a .onnx voice model.
+    Pipes Piper's raw PCM straight into ffmpeg for MP3 encoding — no
+    intermediate WAV on disk. Requires 'piper' and 'ffmpeg' in PATH and a
+    .onnx voice model; the PCM rate comes from the voice's .onnx.json config
+    unless given explicitly.
     """
+    if sample_rate is None:
+        sample_rate = _piper_sample_rate(model_path)
     if shutil.which("piper") is None:
         raise RuntimeError("Piper CLI not found in PATH. See: https://github.com/rhasspy/piper")
+    if shutil.which("ffmpeg") is None:
+        raise RuntimeError("ffmpeg not found in PATH; required to encode Piper output to MP3.")
+
+    piper_proc = subprocess.Popen(
+        ["piper", "--model", str(model_path), "--output-raw"],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+    )
+    # -nostats/-loglevel error: ffmpeg's periodic progress lines could fill
+    # the stderr pipe before we drain it, stalling the whole pipeline on a
+    # long synthesis.
+    ffm_proc = subprocess.Popen(
+        ["ffmpeg", "-y", "-nostats", "-loglevel", "error",
+         "-f", "s16le", "-ar", str(sample_rate), "-ac", "1",
+         "-i", "-", "-codec:a", "libmp3lame", str(out_mp3_path)],
+        stdin=piper_proc.stdout, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    # Close our handle so ffmpeg sees EOF once piper exits.
+    piper_proc.stdout.close()
+
+    _, piper_err = piper_proc.communicate(input=text.encode("utf-8"))
+    _, ffm_err = ffm_proc.communicate()
+    if piper_proc.returncode != 0:
+        raise RuntimeError(f"Piper failed (rc={piper_proc.returncode}). Stderr:\n{piper_err.decode(errors='ignore')}")
+    if ffm_proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed (rc={ffm_proc.returncode}). Stderr:\n{ffm_err.decode(errors='ignore')}")
+
+
+async def _process_file(path: Path, args, sem: asyncio.Semaphore, models):
+    """Rewrite one file and synthesize it; blocking work runs in threads."""
+    input_text = (await asyncio.to_thread(path.read_text, "utf-8")).strip()
+    if not input_text:
+        print(f"Skipping empty file: {path}", file=sys.stderr)
+        return
+
+    # The semaphore caps concurrent LLM requests at what the Ollama server
+    # will actually run in parallel (OLLAMA_NUM_PARALLEL).
+    async with sem:
+        rewritten = await asyncio.to_thread(
+            rewrite_with_ollama,
+            input_text,
+            tone=args.tone,
+            model=args.model,
+            base_url=args.ollama_url,
+            temperature=args.temperature,
+            max_tokens=args.max_tokens,
+            models=models,
+        )
 
-    out_dir = out_mp3_path.parent
-    wav_path = out_dir / (out_mp3_path.stem + ".wav")
-
-    # Piper synth
-    cmd = ["piper", "--model", str(model_path), "--output_file", str(wav_path)]
-    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-    stdout, stderr = proc.communicate(input=text)
-    if proc.returncode != 0:
-        raise RuntimeError(f"Piper failed (rc={proc.returncode}). Stderr:\n{stderr}")
-
-    # Convert WAV -> MP3
-    if shutil.which("ffmpeg"):
-        rc, out, err = run_cmd(["ffmpeg", "-y", "-i", str(wav_path), str(out_mp3_path)])
-        if rc != 0:
-            raise RuntimeError(f"ffmpeg failed to convert WAV->MP3.\n{err}")
-        wav_path.unlink(missing_ok=True)
+    out_dir = ensure_outputs_dir()
+    ts = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    # Embed the source stem in both filenames: the batch shares one tone and
+    # the timestamp only has one-second resolution, so concurrent tasks would
+    # otherwise overwrite each other's text output.
+    text_path = out_dir / f"rewritten_{safe_name(path.stem)}_{safe_name(args.tone)}_{ts}.txt"
+    await asyncio.to_thread(text_path.write_text, rewritten, "utf-8")
+
+    mp3_path = out_dir / f"{args.out_prefix}_{safe_name(path.stem)}_{safe_name(args.tone)}_{ts}.mp3"
+    if args.piper_model:
+        await asyncio.to_thread(tts_with_piper, rewritten, Path(args.piper_model), mp3_path)
     else:
-        if not _HAS_PYDUB:
-            raise RuntimeError("ffmpeg not found and pydub not installed. Install one to get MP3. "
-                               f"WAV file at: {wav_path}")
-        audio = AudioSegment.from_wav(str(wav_path))
-        audio.export(str(out_mp3_path), format="mp3")
-        wav_path.unlink(missing_ok=True)
+        await asyncio.to_thread(tts_with_gtts, rewritten, args.lang, mp3_path)
+    print(f"✓ {path.name}: text → {text_path}, audio → {mp3_path}")
+
+
+async def _process_dir(paths, args, models):
+    """Process all files, reporting per-file failures; returns the failure count."""
+    try:
+        limit = max(1, int(os.getenv("OLLAMA_NUM_PARALLEL", "4")))
+    except ValueError:
+        limit = 4
+    sem = asyncio.Semaphore(limit)
+    results = await asyncio.gather(
+        *[_process_file(p, args, sem, models) for p in paths],
+        return_exceptions=True,
+    )
+    failures = [(p, r) for p, r in zip(paths, results) if isinstance(r, BaseException)]
+    for p, err in failures:
+        print(f"[ERROR] {p.name}: {err}", file=sys.stderr)
+    return len(failures)
 
 
 def main():
@@ -245,12 +303,38 @@ def main():
     parser.add_argument("--tone", help="Tone to use (if omitted, you'll pick interactively)")
     parser.add_argument("--lang", default="en", help="gTTS language code (default: en). Example: te, hi, en, etc.")
     parser.add_argument("--input-file", help="Path to a text file to rewrite (else paste interactively).")
+    parser.add_argument("--input-dir", help="Directory of .txt files to process concurrently (batch mode).")
     parser.add_argument("--temperature", type=float, default=0.7, help="LLM temperature (default: 0.7)")
     parser.add_argument("--max-tokens", type=int, default=512, help="LLM max tokens to generate (default: 512)")
     parser.add_argument("--piper-model", help="Path to a Piper .onnx voice model for offline TTS (optional).")
     parser.add_argument("--out-prefix", default="speech", help="Filename prefix for saved MP3 (default: speech)")
     args = parser.parse_args()
 
+    # Batch mode: process every .txt in a directory concurrently, overlapping
+    # the Ollama and TTS round-trips across files.
+    if args.input_dir:
+        in_dir = Path(args.input_dir)
+        paths = sorted(in_dir.glob("*.txt"))
+        if not paths:
+            print(f"No .txt files found in: {in_dir}", file=sys.stderr)
+            sys.exit(1)
+        args.tone = args.tone or pick_tone_interactive(DEFAULT_TONES)
+        # Verify the model once up front; per-file rewrites reuse this list
+        # instead of each paying an /api/tags round-trip.
+        models = ollama_models(args.ollama_url)
+        try:
+            ensure_model_present(args.model, args.ollama_url, models=models)
+        except RuntimeError as e:
+            print(f"\n[ERROR] {e}", file=sys.stderr)
+            sys.exit(2)
+        print(f"\n→ Rewriting {len(paths)} files with Ollama model '{args.model}' in tone: {args.tone}")
+        failed = asyncio.run(_process_dir(paths, args, models))
+        if failed:
+            print(f"\n{failed} of {len(paths)} files failed; see errors above.", file=sys.stderr)
+            sys.exit(2)
+        print("\nDone.")
+        return
+
     # Gather text
     if args.input_file:
         src = Path(args.input_file)
@@ -288,7 +372,7 @@ def main():
     # TTS
     out_dir = ensure_outputs_dir()
     ts = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
-    safe_tone = "".join(c for c in tone if c.isalnum() or c in ("-", "_")).strip("_")
+    safe_tone = safe_name(tone)
     mp3_path = out_dir / f"{args.out_prefix}_{safe_tone}_{ts}.mp3"
 
     try: